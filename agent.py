@@ -12,8 +12,10 @@ Environment Variables:
     ANTHROPIC_API_KEY: API key for Claude
     OPENAI_API_KEY: API key for OpenAI/Codex
     KIMMY_K2_API_KEY: API key for Kimmy K2
+    LOG_LEVEL: Agent log verbosity (DEBUG, INFO, WARNING, ERROR) - default: INFO
 """
 
+import logging
 import os
 import sys
 
@@ -25,6 +27,16 @@ from libs.providers.base import ProviderError
 def main():
     """Run agent with configured provider."""
     
+    log_level = os.getenv("LOG_LEVEL", "INFO").upper()
+    if not isinstance(logging.getLevelName(log_level), int):
+        print(f"WARNING: unknown LOG_LEVEL {log_level!r}, using INFO", file=sys.stderr)
+        log_level = "INFO"
+    logging.basicConfig(
+        level=log_level,
+        format="%(message)s",
+        stream=sys.stdout
+    )
+    
     config = Config()
     
     if not config.validate():
@@ -54,6 +66,7 @@ def main():
             print("  OPENAI_API_KEY    API key for OpenAI/Codex")
             print("  KIMMY_K2_API_KEY  API key for Kimmy K2")
             print("  OPENCODE_MODEL    Model override (e.g., glm-5)")
+            print("  LOG_LEVEL         Agent log verbosity (default: INFO)")
             print("")
             print("Available Providers:")
             for name, desc in list_providers().items():
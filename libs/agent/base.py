@@ -5,62 +5,137 @@ Provides the core agent functionality with tool execution.
 """
 
 import json
+import logging
 import re
 import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Any, Optional, Callable
 
+from libs import jsonutil
 from libs.providers.base import BaseProvider, ProviderError
 from libs.tools.tools import ToolRegistry
 
 
+logger = logging.getLogger("ralph")
+
+# Fenced ```tool blocks and [TOOL: name] [ARGS: {...}] tags, matched in one pass.
+_TOOL_RE = re.compile(
+    r'```(?:tool|bash|command)\s*\n(?P<body>.*?)\n```'
+    r'|\[TOOL:\s*(?P<name>\w+)\s*\]\s*\[ARGS:\s*(?P<args>{.*?})\s*\]',
+    re.DOTALL
+)
+
+_PREVIEW_ENCODER = json.JSONEncoder(indent=2, default=str, ensure_ascii=False)
+
+
+def _preview(obj: Any, limit: int = 500) -> str:
+    """
+    Pretty-print obj as JSON, cut to limit characters followed by "...".
+    
+    The stdlib encoder produces output incrementally, so encoding stops as soon
+    as the limit is passed instead of serializing a large tool result in full
+    only to display its first few hundred characters.
+    """
+    parts = []
+    size = 0
+    for chunk in _PREVIEW_ENCODER.iterencode(obj):
+        parts.append(chunk)
+        size += len(chunk)
+        if size > limit:
+            return ''.join(parts)[:limit] + "..."
+    return ''.join(parts)
+
+
 class BaseAgent:
     """
     Base agent with conversation history, tool execution, and provider integration.
     """
     
+    # Tools without side effects. Consecutive calls to these within one model
+    # turn run concurrently; any other tool call is executed on its own.
+    concurrent_tools = frozenset({"read", "list_files", "glob", "grep"})
+    max_tool_workers = 8
+    
     def __init__(
         self,
         provider: BaseProvider,
         max_iterations: int = 100,
         tools: Optional[ToolRegistry] = None,
-        retry_on_error: int = 2
+        retry_on_error: int = 2,
+        history_token_budget: Optional[int] = 100_000,
+        keep_tool_results: int = 5
     ):
+        """
+        Args:
+            provider: Provider used for chat completions
+            max_iterations: Maximum model turns per run
+            tools: Tool registry (default: the standard tools)
+            retry_on_error: Provider errors tolerated in a row before giving up
+            history_token_budget: Estimated token size of the conversation above
+                which older tool results are collapsed to one-line stubs
+                (None disables trimming)
+            keep_tool_results: Number of most recent tool-result messages that
+                are never collapsed
+        """
         self.provider = provider
         self.max_iterations = max_iterations
         self.conversation_history: List[Dict[str, Any]] = []
         self.tools = tools or ToolRegistry()
+        self._tool_table = self.tools.dispatch_table()
         self.retry_on_error = retry_on_error
+        self.history_token_budget = history_token_budget
+        self.keep_tool_results = keep_tool_results
+        # (history index, tool names) of tool-result messages not yet collapsed, oldest first.
+        self._tool_result_messages: List[tuple] = []
+        self._tool_instructions: Optional[str] = None
+        self._tool_executor: Optional[ThreadPoolExecutor] = None
     
     def _parse_tool_calls(self, content: str) -> List[Dict[str, Any]]:
-        """Parse tool calls from model response."""
+        """Parse tool calls from model response, in the order they appear."""
         tool_calls = []
         
-        md_pattern = r'```(?:tool|bash|command)\s*\n(.*?)\n```'
-        for match in re.finditer(md_pattern, content, re.DOTALL):
-            try:
-                tool_data = json.loads(match.group(1))
-                if isinstance(tool_data, dict) and 'tool' in tool_data:
-                    tool_calls.append({
-                        "tool": tool_data['tool'],
-                        "args": tool_data.get('args', tool_data.get('arguments', {}))
-                    })
-            except json.JSONDecodeError:
-                tool_calls.append({"tool": "bash", "args": {"command": match.group(1).strip()}})
-        
-        bracket_pattern = r'\[TOOL:\s*(\w+)\s*\]\s*\[ARGS:\s*({.*?})\s*\]'
-        for match in re.finditer(bracket_pattern, content, re.DOTALL):
+        for match in _TOOL_RE.finditer(content):
+            body = match.group('body')
+            if body is not None:
+                try:
+                    tool_data = jsonutil.loads(body)
+                    if isinstance(tool_data, dict) and 'tool' in tool_data:
+                        tool_calls.append({
+                            "tool": tool_data['tool'],
+                            "args": tool_data.get('args', tool_data.get('arguments', {}))
+                        })
+                except jsonutil.JSONDecodeError:
+                    tool_calls.append({"tool": "bash", "args": {"command": body.strip()}})
+                continue
+            
             try:
-                tool_name = match.group(1)
-                args = json.loads(match.group(2))
-                tool_calls.append({"tool": tool_name, "args": args})
-            except (json.JSONDecodeError, KeyError, TypeError):
+                args = jsonutil.loads(match.group('args'))
+                tool_calls.append({"tool": match.group('name'), "args": args})
+            except (jsonutil.JSONDecodeError, KeyError, TypeError):
                 pass
         
         return tool_calls
     
     def _execute_tool(self, tool_name: str, args: Dict[str, Any]) -> Dict[str, Any]:
-        """Execute a tool and return result."""
-        tool_func = self.tools.get(tool_name)
+        """
+        Execute a tool and return result.
+        
+        The call is logged before the tool runs, so a long bash command shows
+        up while it is still running, and the result once it returns.
+        """
+        log_info = logger.isEnabledFor(logging.INFO)
+        if log_info:
+            args_str = jsonutil.dumps(args, pretty=True) if isinstance(args, dict) else args
+            logger.info("[Tool] %s(%s)", tool_name, args_str)
+        
+        result = self._run_tool(tool_name, args)
+        
+        if log_info:
+            logger.info("[Result] %s", _preview(result))
+        return result
+    
+    def _run_tool(self, tool_name: str, args: Dict[str, Any]) -> Dict[str, Any]:
+        tool_func = self._tool_table.get(tool_name)
         
         if tool_func is None:
             return {"success": False, "error": f"Unknown tool: {tool_name}"}
@@ -71,6 +146,46 @@ class BaseAgent:
         except Exception as e:
             return {"success": False, "error": f"Tool execution error: {str(e)}"}
     
+    def _execute_tool_calls(self, tool_calls: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Execute the tool calls of one model turn and return results in call order.
+        
+        Runs of consecutive concurrent_tools calls share a thread pool; every
+        other call is a barrier, so a read issued after a write or bash call
+        in the same turn still sees its effects.
+        """
+        results: List[Optional[Dict[str, Any]]] = [None] * len(tool_calls)
+        batch: List[int] = []
+        
+        def flush():
+            if len(batch) == 1:
+                index = batch[0]
+                results[index] = self._execute_tool(tool_calls[index].get("tool"), tool_calls[index].get("args", {}))
+            elif batch:
+                if self._tool_executor is None:
+                    self._tool_executor = ThreadPoolExecutor(
+                        max_workers=self.max_tool_workers,
+                        thread_name_prefix="ralph-tool"
+                    )
+                calls = [tool_calls[index] for index in batch]
+                batch_results = self._tool_executor.map(
+                    lambda call: self._execute_tool(call.get("tool"), call.get("args", {})),
+                    calls
+                )
+                for index, result in zip(batch, batch_results):
+                    results[index] = result
+            batch.clear()
+        
+        for index, tool_call in enumerate(tool_calls):
+            if tool_call.get("tool") in self.concurrent_tools:
+                batch.append(index)
+                continue
+            flush()
+            results[index] = self._execute_tool(tool_call.get("tool"), tool_call.get("args", {}))
+        flush()
+        
+        return results
+    
     def run(
         self,
         prompt: str,
@@ -97,6 +212,7 @@ class BaseAgent:
         
         messages.append({"role": "user", "content": prompt})
         self.conversation_history = list(messages)
+        self._tool_result_messages = []
         
         iteration = 0
         final_response = None
@@ -116,7 +232,7 @@ class BaseAgent:
             except ProviderError as e:
                 consecutive_errors += 1
                 error_msg = str(e)
-                print(f"\n[Error] Provider error (attempt {consecutive_errors}): {error_msg[:200]}")
+                logger.error("\n[Error] Provider error (attempt %d): %s", consecutive_errors, error_msg[:200])
                 
                 if consecutive_errors > self.retry_on_error:
                     return {
@@ -142,44 +258,69 @@ class BaseAgent:
                 break
             
             tool_results = []
-            for tool_call in tool_calls:
+            for tool_call, result in zip(tool_calls, self._execute_tool_calls(tool_calls)):
                 tool_name = tool_call.get("tool")
                 tool_args = tool_call.get("args", {})
                 
-                print(f"[Tool] {tool_name}({json.dumps(tool_args, indent=2) if isinstance(tool_args, dict) else tool_args})")
-                
-                result = self._execute_tool(tool_name, tool_args)
                 tool_results.append({
                     "tool": tool_name,
                     "args": tool_args,
                     "result": result
                 })
-                
-                result_str = json.dumps(result, indent=2)
-                if len(result_str) > 500:
-                    result_str = result_str[:500] + "..."
-                print(f"[Result] {result_str}")
             
             result_message = {
                 "role": "user",
-                "content": f"Tool execution results:\n{json.dumps(tool_results, indent=2)}"
+                "content": f"Tool execution results:\n{jsonutil.dumps(tool_results, pretty=True)}"
             }
+            self._tool_result_messages.append(
+                (len(self.conversation_history), [tool_call.get("tool") for tool_call in tool_calls])
+            )
             self.conversation_history.append(result_message)
+            self._trim_history()
         
         if final_response is None:
             return {"error": True, "message": "No response from provider"}
         
         if iteration >= self.max_iterations:
-            print(f"\n[Warning] Reached max iterations ({self.max_iterations}), returning last response")
+            logger.warning("\n[Warning] Reached max iterations (%d), returning last response", self.max_iterations)
         
         return final_response
     
+    def _trim_history(self):
+        """
+        Collapse the oldest tool-result messages while the history is over budget.
+        
+        Providers re-process the whole conversation every turn, so stale tool
+        output makes each later request slower and more expensive. Tokens are
+        estimated as characters / 4. The last keep_tool_results results are
+        kept verbatim. Collapsed messages are replaced with new stub dicts.
+        """
+        if self.history_token_budget is None:
+            return
+        
+        history = self.conversation_history
+        estimated = sum(len(message.get("content", "")) for message in history) // 4
+        
+        while estimated > self.history_token_budget and len(self._tool_result_messages) > self.keep_tool_results:
+            index, tool_names = self._tool_result_messages.pop(0)
+            old_content = history[index].get("content", "")
+            stub = f"<<{', '.join(str(name) for name in tool_names)}: {len(old_content)} chars of tool results truncated>>"
+            history[index] = {"role": "user", "content": stub}
+            estimated -= (len(old_content) - len(stub)) // 4
+    
     def reset(self):
         """Reset conversation history."""
         self.conversation_history = []
+        self._tool_result_messages = []
     
     def get_tool_instructions(self) -> str:
         """Get formatted tool instructions to include in prompts."""
+        if self._tool_instructions is None:
+            self._tool_instructions = self._format_tool_instructions()
+        return self._tool_instructions
+    
+    def _format_tool_instructions(self) -> str:
+        """Build the tool instructions text; cached by get_tool_instructions."""
         return f"""
 IMPORTANT: You have access to the following tools. Use them by writing tool calls in this format:
 ```tool
@@ -0,0 +1,45 @@
+"""
+JSON Helpers
+
+Serialization used on the agent and provider hot paths. Uses orjson when it
+is installed and falls back to the standard library json module otherwise.
+"""
+
+import json
+from typing import Any, Union
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# orjson.JSONDecodeError subclasses json.JSONDecodeError, so one except clause covers both.
+JSONDecodeError = json.JSONDecodeError
+
+
+def dumps(obj: Any, pretty: bool = False) -> str:
+    """Serialize obj to a JSON string, indented by two spaces if pretty."""
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS
+        if pretty:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=str, option=option).decode('utf-8')
+    return json.dumps(obj, indent=2 if pretty else None, default=str, ensure_ascii=False)
+
+
+def dumps_bytes(obj: Any, sort_keys: bool = False) -> bytes:
+    """Serialize obj to compact UTF-8 encoded JSON, e.g. for a request body."""
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, option=option)
+    return json.dumps(obj, separators=(',', ':'), ensure_ascii=False, sort_keys=sort_keys).encode('utf-8')
+
+
+def loads(data: Union[str, bytes]) -> Any:
+    """Parse JSON from a str or UTF-8 encoded bytes."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
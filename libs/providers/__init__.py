@@ -3,6 +3,7 @@ libs/providers/__init__.py
 """
 
 from libs.providers.base import BaseProvider
+from libs.providers.cache import LLMCache
 from libs.providers.glm import GLMProvider
 from libs.providers.claude import ClaudeProvider
 from libs.providers.codex import CodexProvider
@@ -10,6 +11,7 @@ from libs.providers.kimmy_k2 import KimmyK2Provider
 
 __all__ = [
     "BaseProvider",
+    "LLMCache",
     "GLMProvider",
     "ClaudeProvider",
     "CodexProvider",
@@ -4,30 +4,118 @@ Base Provider Interface
 All AI providers must implement this interface.
 """
 
+import asyncio
+import base64
+import functools
+import http.client
+import logging
+import threading
+import time
+import urllib.parse
+import urllib.request
 from abc import ABC, abstractmethod
-from typing import Dict, Any, List, Optional
+from collections import OrderedDict
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+
+from libs import jsonutil
+from libs.providers.cache import LLMCache
+
+
+# Child of the agent's "ralph" logger, so LOG_LEVEL controls it too.
+logger = logging.getLogger("ralph.providers")
+
+# A message's items, recorded when its encoding was cached.
+MessageSnapshot = Tuple[Tuple[str, str], ...]
+
+# Encoded message bytes shared by every provider instance, so the same history
+# sent to several providers (or several instances) is serialized once. Keyed by
+# id() and holding the message itself, which keeps the id from being reused.
+# Least recently used entries are dropped once the encodings total more than
+# SHARED_ENCODING_MAX_BYTES, which also releases finished histories.
+SHARED_ENCODING_MAX_BYTES = 16 * 1024 * 1024
+_shared_encodings: "OrderedDict[int, Tuple[Dict[str, Any], MessageSnapshot, bytes]]" = OrderedDict()
+_shared_encodings_size = 0
+_shared_encodings_lock = threading.Lock()
+
+
+def _snapshot(message: Dict[str, Any]) -> Optional[MessageSnapshot]:
+    """
+    Return the message's items if every value is a str, else None.
+    
+    Only such messages have their encoding cached: any in-place change to
+    them (new content or role, an added or removed key) shows up as a
+    different snapshot, which list-valued content could not guarantee.
+    """
+    items = tuple(message.items())
+    for _, value in items:
+        if type(value) is not str:
+            return None
+    return items
+
+
+def _encode_message(message: Dict[str, Any], snapshot: Optional[MessageSnapshot]) -> bytes:
+    """Encode one message, reusing bytes already produced for the same unchanged dict."""
+    global _shared_encodings_size
+    if snapshot is None:
+        return jsonutil.dumps_bytes(message)
+    key = id(message)
+    with _shared_encodings_lock:
+        entry = _shared_encodings.get(key)
+        if entry is not None and entry[0] is message and entry[1] == snapshot:
+            _shared_encodings.move_to_end(key)
+            return entry[2]
+    encoded = jsonutil.dumps_bytes(message)
+    with _shared_encodings_lock:
+        old = _shared_encodings.pop(key, None)
+        if old is not None:
+            _shared_encodings_size -= len(old[2])
+        _shared_encodings[key] = (message, snapshot, encoded)
+        _shared_encodings_size += len(encoded)
+        while _shared_encodings_size > SHARED_ENCODING_MAX_BYTES:
+            _, (_, _, dropped) = _shared_encodings.popitem(last=False)
+            _shared_encodings_size -= len(dropped)
+    return encoded
 
 
 class BaseProvider(ABC):
     """Abstract base class for AI providers."""
     
     name: str = "base"
+    # Service name used in error messages, e.g. "OpenAI" for the codex provider.
+    api_name: str = "API"
     default_model: str = ""
     max_output_tokens: int = 16384
+    max_retries: int = 3
+    retry_delay: int = 2
     
     def __init__(
         self,
         api_key: str,
         model: Optional[str] = None,
         base_url: Optional[str] = None,
+        cache: Optional[LLMCache] = None,
         **kwargs
     ):
         self.api_key = api_key
         self.model = model or self.default_model
         self.base_url = base_url
+        self.cache = cache
         self.extra_kwargs = kwargs
+        # (message, its snapshot when encoded, encoded bytes) per history entry.
+        self._encoded_messages: List[Tuple[Dict[str, Any], Optional[MessageSnapshot], bytes]] = []
+        self._encode_lock = threading.Lock()
+        # One keep-alive connection per thread: http.client connections are
+        # not safe to share, and tools or callers may chat from several threads.
+        self._local = threading.local()
+        self._connections: List[http.client.HTTPConnection] = []
+        self._connections_lock = threading.Lock()
+    
+    def __enter__(self) -> "BaseProvider":
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
     
-    @abstractmethod
     def chat(
         self,
         messages: List[Dict[str, Any]],
@@ -38,6 +126,10 @@ class BaseProvider(ABC):
         """
         Send a chat completion request.
         
+        With a cache configured, deterministic requests (temperature <= 0)
+        are answered from it when possible; such responses carry
+        'cached': True.
+        
         Args:
             messages: List of message dicts with 'role' and 'content'
             temperature: Sampling temperature
@@ -52,8 +144,72 @@ class BaseProvider(ABC):
         Raises:
             ProviderError: On API errors
         """
+        if max_tokens is not None:
+            kwargs["max_tokens"] = max_tokens
+        
+        if self.cache is None or temperature is None or temperature > 0:
+            return self._chat(messages, temperature, **kwargs)
+        
+        request = {
+            "provider": self.name,
+            "model": self.model,
+            "messages": messages,
+            "temperature": temperature,
+            "options": kwargs,
+        }
+        cached = self.cache.lookup(request)
+        if cached is not None:
+            return dict(cached, cached=True)
+        
+        response = self._chat(messages, temperature, **kwargs)
+        self.cache.store(request, response)
+        return response
+    
+    @abstractmethod
+    def _chat(
+        self,
+        messages: List[Dict[str, Any]],
+        temperature: float = 0.7,
+        max_tokens: int = None,
+        **kwargs
+    ) -> Dict[str, Any]:
+        """Send the request to the provider's API; see chat()."""
         pass
     
+    async def achat(
+        self,
+        messages: List[Dict[str, Any]],
+        temperature: float = 0.7,
+        max_tokens: int = None,
+        **kwargs
+    ) -> Dict[str, Any]:
+        """
+        Async variant of chat(), for issuing several requests with asyncio.gather.
+        
+        The blocking chat() call runs on a worker thread; each thread keeps its
+        own keep-alive connection, so concurrent calls do not serialize on one
+        socket. Arguments and return value are the same as chat().
+        """
+        return await asyncio.to_thread(self.chat, messages, temperature, max_tokens, **kwargs)
+    
+    def chat_stream(
+        self,
+        messages: List[Dict[str, Any]],
+        temperature: float = 0.7,
+        max_tokens: int = None,
+        **kwargs
+    ) -> Iterator[str]:
+        """
+        Send a chat completion request and yield the content as it arrives.
+        
+        Providers with a streaming API override this to yield chunks while
+        the response is still being generated; ''.join() of the chunks is the
+        full content. This fallback yields chat()'s content in one piece.
+        """
+        if max_tokens is not None:
+            kwargs["max_tokens"] = max_tokens
+        yield self.chat(messages, temperature, **kwargs)["content"]
+    
     @abstractmethod
     def get_model_name(self) -> str:
         """Return the model name being used."""
@@ -71,6 +227,301 @@ class BaseProvider(ABC):
             return False
         return True
     
+    def _encode_messages(self, messages: List[Dict[str, Any]]) -> bytes:
+        """
+        Encode messages as a JSON array, reusing the bytes of an unchanged prefix.
+        
+        The agent's conversation history only grows by appending new message
+        dicts, so each call re-encodes just the messages added since the
+        previous one, and those come from the module-wide encoding cache when
+        another provider has already sent them. A cached entry is reused only
+        for the same message dict with an unchanged _snapshot(), so changing a
+        message in place re-encodes it; messages with non-str values, such as
+        list content blocks, are encoded every time.
+        """
+        with self._encode_lock:
+            cached = self._encoded_messages
+            n = 0
+            limit = min(len(cached), len(messages))
+            while n < limit:
+                message, snapshot, _ = cached[n]
+                if message is not messages[n] or snapshot is None or snapshot != _snapshot(message):
+                    break
+                n += 1
+            del cached[n:]
+            for message in messages[n:]:
+                snapshot = _snapshot(message)
+                cached.append((message, snapshot, _encode_message(message, snapshot)))
+            return b'[' + b','.join(encoded for _, _, encoded in cached) + b']'
+    
+    def _encode_payload(self, payload: Dict[str, Any]) -> bytes:
+        """Encode a request body, serializing its 'messages' via _encode_messages."""
+        if "messages" not in payload:
+            return jsonutil.dumps_bytes(payload)
+        
+        rest = {key: value for key, value in payload.items() if key != "messages"}
+        messages = self._encode_messages(payload["messages"])
+        head = jsonutil.dumps_bytes(rest)
+        separator = b',' if rest else b''
+        return head[:-1] + separator + b'"messages":' + messages + b'}'
+    
+    def close(self) -> None:
+        """Close the keep-alive connections opened by every thread."""
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+    
+    def _drop_connection(self) -> None:
+        """Close and forget the calling thread's connection."""
+        conn = getattr(self._local, 'conn', None)
+        self._local.conn = None
+        if conn is not None:
+            conn.close()
+            with self._connections_lock:
+                if conn in self._connections:
+                    self._connections.remove(conn)
+    
+    def _has_connection(self) -> bool:
+        """Whether the calling thread has a connection that close() has not closed."""
+        conn = getattr(self._local, 'conn', None)
+        with self._connections_lock:
+            return conn is not None and conn in self._connections
+    
+    @functools.cached_property
+    def _url_parts(self) -> urllib.parse.SplitResult:
+        """base_url split into scheme, host and path, parsed on first use."""
+        return urllib.parse.urlsplit(self.base_url)
+    
+    @functools.cached_property
+    def _proxy(self) -> Optional[urllib.parse.SplitResult]:
+        """
+        Proxy for base_url from HTTP_PROXY / HTTPS_PROXY / NO_PROXY, or None.
+        
+        Resolved the way urlopen's default ProxyHandler does, so the providers
+        work unchanged in proxied environments.
+        """
+        proxy = urllib.request.getproxies().get(self._url_parts.scheme)
+        if not proxy or urllib.request.proxy_bypass(self._url_parts.hostname or ''):
+            return None
+        if '://' not in proxy:
+            proxy = 'http://' + proxy
+        return urllib.parse.urlsplit(proxy)
+    
+    @functools.cached_property
+    def _proxy_headers(self) -> Dict[str, str]:
+        """Proxy-Authorization header for credentials in the proxy URL, if any."""
+        proxy = self._proxy
+        if proxy is None or proxy.username is None:
+            return {}
+        credentials = f"{urllib.parse.unquote(proxy.username)}:{urllib.parse.unquote(proxy.password or '')}"
+        token = base64.b64encode(credentials.encode('utf-8')).decode('ascii')
+        return {'Proxy-Authorization': f'Basic {token}'}
+    
+    def _get_connection(self, timeout: int) -> http.client.HTTPConnection:
+        """
+        Return the calling thread's persistent connection, creating it on first use.
+        
+        Behind a proxy, HTTPS requests go through a CONNECT tunnel and plain
+        HTTP requests are sent to the proxy itself (see _request).
+        """
+        if not self._has_connection():
+            if self._url_parts.scheme == 'http':
+                conn_class = http.client.HTTPConnection
+            else:
+                conn_class = http.client.HTTPSConnection
+            proxy = self._proxy
+            # http.client already sets TCP_NODELAY when it connects.
+            if proxy is None:
+                conn = conn_class(self._url_parts.netloc, timeout=timeout)
+            else:
+                conn = conn_class(proxy.hostname, proxy.port, timeout=timeout)
+                if conn_class is http.client.HTTPSConnection:
+                    conn.set_tunnel(self._url_parts.hostname, self._url_parts.port, headers=self._proxy_headers)
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return self._local.conn
+    
+    def _request(
+        self,
+        conn: http.client.HTTPConnection,
+        path: str,
+        data: bytes,
+        headers: Dict[str, str]
+    ) -> http.client.HTTPResponse:
+        """POST data on conn and return the response, addressing an HTTP proxy when one is used."""
+        if self._proxy is not None and self._url_parts.scheme == 'http':
+            path = f"http://{self._url_parts.netloc}{path}"
+            headers = dict(headers, **self._proxy_headers)
+        conn.request('POST', path, body=data, headers=headers)
+        return conn.getresponse()
+    
+    def _send(
+        self,
+        path: str,
+        data: bytes,
+        headers: Dict[str, str],
+        timeout: int
+    ) -> Tuple[int, bytes]:
+        """
+        POST over the persistent connection and return (status, body).
+    
+        The server may drop an idle keep-alive connection between agent turns,
+        so a reused connection that fails before any response is reopened once
+        straight away instead of surfacing as a request failure.
+        """
+        while True:
+            reused = self._has_connection()
+            conn = self._get_connection(timeout)
+            try:
+                response = self._request(conn, path, data, headers)
+                return response.status, response.read()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                self._drop_connection()
+                if not reused:
+                    raise
+            except BaseException:
+                self._drop_connection()
+                raise
+    
+    def _post_json(
+        self,
+        path: str,
+        payload: Dict[str, Any],
+        headers: Dict[str, str],
+        timeout: int = 120
+    ) -> Dict[str, Any]:
+        """
+        POST payload as JSON and return the decoded response.
+        
+        Connection errors, 5xx and 429 responses are retried up to max_retries
+        times with exponential backoff; every failure is raised as ProviderError.
+        """
+        data = self._encode_payload(payload)
+        last_error = None
+        
+        for attempt in range(self.max_retries):
+            try:
+                status, body = self._send(path, data, headers, timeout)
+                
+                if status >= 400:
+                    error_body = body.decode('utf-8', errors='replace') or 'No body'
+                    
+                    if status >= 500 or status == 429:
+                        last_error = f"{self.api_name} API error: {status} - {error_body}"
+                        if attempt < self.max_retries - 1:
+                            wait_time = self.retry_delay * (2 ** attempt)
+                            logger.warning("[%s] Retryable error %d, waiting %ds...", self.api_name, status, wait_time)
+                            time.sleep(wait_time)
+                            continue
+                    raise ProviderError(
+                        f"{self.api_name} API error: {status} - {error_body}",
+                        provider=self.name,
+                        raw_error=error_body
+                    )
+                
+                return jsonutil.loads(body)
+            
+            except (http.client.HTTPException, ConnectionError, TimeoutError, OSError) as e:
+                last_error = str(e)
+                if attempt < self.max_retries - 1:
+                    wait_time = self.retry_delay * (2 ** attempt)
+                    logger.warning("[%s] Connection error: %s, retrying in %ds...", self.api_name, e, wait_time)
+                    time.sleep(wait_time)
+                    continue
+            
+            except jsonutil.JSONDecodeError as e:
+                raise ProviderError(
+                    f"Invalid JSON response from {self.api_name}: {e}",
+                    provider=self.name,
+                    raw_error=e
+                )
+        
+        raise ProviderError(
+            f"{self.api_name} request failed after {self.max_retries} retries: {last_error}",
+            provider=self.name,
+            raw_error=last_error
+        )
+    
+    def _post_stream(
+        self,
+        path: str,
+        payload: Dict[str, Any],
+        headers: Dict[str, str],
+        timeout: int = 120
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        POST payload with "stream": true and yield each server-sent event's data.
+        
+        Events are decoded as soon as their line arrives. An error event sent
+        mid-stream ({"type": "error", ...} from Anthropic, {"error": {...}}
+        from OpenAI-style APIs) raises ProviderError, so a cut-off reply is not
+        mistaken for a complete one. Only a stale keep-alive connection is
+        retried, since chunks may already have been handed to the caller; other
+        failures raise ProviderError. If the caller stops early, the connection
+        is dropped rather than reused mid-response.
+        """
+        data = self._encode_payload(dict(payload, stream=True))
+        finished = False
+        try:
+            reused = self._has_connection()
+            conn = self._get_connection(timeout)
+            try:
+                response = self._request(conn, path, data, headers)
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                if not reused:
+                    raise
+                self._drop_connection()
+                conn = self._get_connection(timeout)
+                response = self._request(conn, path, data, headers)
+            
+            if response.status >= 400:
+                error_body = response.read().decode('utf-8', errors='replace') or 'No body'
+                finished = True
+                raise ProviderError(
+                    f"{self.api_name} API error: {response.status} - {error_body}",
+                    provider=self.name,
+                    raw_error=error_body
+                )
+            
+            for line in response:
+                if not line.startswith(b'data:'):
+                    continue
+                frame = line[5:].strip()
+                if frame == b'[DONE]':
+                    break
+                if not frame:
+                    continue
+                event = jsonutil.loads(frame)
+                if isinstance(event, dict) and (event.get("type") == "error" or "error" in event):
+                    error = event.get("error")
+                    message = error.get("message") if isinstance(error, dict) else error
+                    raise ProviderError(
+                        f"{self.api_name} stream error: {message or frame.decode('utf-8', errors='replace')}",
+                        provider=self.name,
+                        raw_error=event
+                    )
+                yield event
+            response.read()
+            finished = True
+        
+        except jsonutil.JSONDecodeError as e:
+            raise ProviderError(
+                f"Invalid JSON in {self.api_name} stream: {e}",
+                provider=self.name,
+                raw_error=e
+            )
+        except (http.client.HTTPException, ConnectionError, TimeoutError, OSError) as e:
+            raise ProviderError(
+                f"{self.api_name} stream failed: {e}",
+                provider=self.name,
+                raw_error=e
+            )
+        finally:
+            if not finished:
+                self._drop_connection()
+    
     def __repr__(self) -> str:
         return f"{self.__class__.__name__}(model={self.model})"
 
@@ -0,0 +1,217 @@
+"""
+LLM Response Cache
+
+Caches deterministic (temperature <= 0) chat responses so repeated prompts
+are answered from memory instead of another API round trip.
+"""
+
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
+
+from libs import jsonutil
+
+
+# Where callers conventionally point the optional on-disk cache.
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "ralph-loop")
+
+# Volatile spans the structural cache abstracts over: the directory part of
+# an absolute path (the basename is kept) and standalone integers.
+_SPAN_RE = re.compile(r'(?<![\w.])/(?:[\w.\-]+/)+|\b\d+\b')
+# The same spans, plus literal "<", which _normalize doubles so that text
+# already containing "<N>" or "<P>/" cannot collide with a placeholder.
+_NORMALIZE_RE = re.compile('<|' + _SPAN_RE.pattern)
+_WHITESPACE_RE = re.compile(r'\s+')
+# Marks where the i-th span of the original request appeared in a cached response.
+_SLOT_RE = re.compile(r'\x00(\d+)\x00')
+
+
+def _normalize(text: str, spans: List[str]) -> str:
+    """Replace volatile spans with placeholders, appending them to spans, and collapse whitespace."""
+    def placeholder(match: re.Match) -> str:
+        if match.group() == '<':
+            return '<<'
+        spans.append(match.group())
+        return '<P>/' if match.group().startswith('/') else '<N>'
+    
+    return _WHITESPACE_RE.sub(' ', _NORMALIZE_RE.sub(placeholder, text)).strip()
+
+
+def structural_key(request: Dict[str, Any]) -> Tuple[Dict[str, Any], List[str]]:
+    """
+    Return request with its message contents normalized, plus the spans removed.
+    
+    Two requests that differ only in paths, numbers or whitespace map to the
+    same normalized request; the spans (in order) say how they differ.
+    """
+    spans: List[str] = []
+    messages = [
+        dict(message, content=_normalize(message["content"], spans))
+        if isinstance(message.get("content"), str) else message
+        for message in request.get("messages", [])
+    ]
+    return dict(request, messages=messages), spans
+
+
+def _to_template(text: str, spans: List[str]) -> str:
+    """Replace occurrences of the request's spans in text with numbered slots."""
+    first_index: Dict[str, int] = {}
+    for i, span in enumerate(spans):
+        first_index.setdefault(span, i)
+    if not first_index:
+        return text
+    
+    alternatives = []
+    for span in sorted(first_index, key=len, reverse=True):
+        if span.startswith('/'):
+            alternatives.append(r'(?<![\w.])' + re.escape(span))
+        else:
+            alternatives.append(r'\b' + re.escape(span) + r'\b')
+    pattern = re.compile('|'.join(alternatives))
+    return pattern.sub(lambda m: f'\x00{first_index[m.group()]}\x00', text)
+
+
+def _from_template(template: str, spans: List[str]) -> str:
+    """Fill numbered slots with the spans of the current request; IndexError if one is missing."""
+    return _SLOT_RE.sub(lambda m: spans[int(m.group(1))], template)
+
+
+class LLMCache:
+    """
+    LRU cache of chat responses, optionally persisted to a directory.
+    
+    Pass an instance to a provider as cache=...; one cache may be shared by
+    several providers, since the provider name and model are part of each key.
+    
+    With enable_structural_cache, a request that misses exactly but matches
+    an earlier one after normalizing paths, numbers and whitespace is
+    answered from that response, with the earlier request's paths and
+    numbers in its content swapped for the current ones. This can return a
+    wrong answer when the normalized-away details matter, so it is off by
+    default.
+    """
+    
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        directory: Optional[str] = None,
+        enable_structural_cache: bool = False
+    ):
+        self.max_entries = max_entries
+        self.directory = directory
+        self.enable_structural_cache = enable_structural_cache
+        self.hits = 0
+        self.misses = 0
+        self.structural_hits = 0
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+    
+    @staticmethod
+    def make_key(request: Dict[str, Any]) -> str:
+        """Hash a request description into a cache key."""
+        return hashlib.sha256(jsonutil.dumps_bytes(request, sort_keys=True)).hexdigest()
+    
+    def lookup(self, request: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Return the cached response for a request description, or None, counting the hit or miss."""
+        response = self.get(self.make_key(request))
+        structural = False
+        
+        if response is None and self.enable_structural_cache:
+            normalized, spans = structural_key(request)
+            template = self.get(self.make_key({"structural": normalized}))
+            if template is not None and isinstance(template.get("content"), str):
+                try:
+                    response = dict(template, content=_from_template(template["content"], spans))
+                    structural = True
+                except IndexError:
+                    # A slot this request has no span for; treat it as a miss.
+                    pass
+        
+        with self._lock:
+            if response is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.structural_hits += structural
+        return response
+    
+    def store(self, request: Dict[str, Any], response: Dict[str, Any]) -> None:
+        """Cache the response to a request description."""
+        self.put(self.make_key(request), response)
+        if self.enable_structural_cache and isinstance(response.get("content"), str):
+            normalized, spans = structural_key(request)
+            template = dict(response, content=_to_template(response["content"], spans))
+            self.put(self.make_key({"structural": normalized}), template)
+    
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the entry stored under key, or None."""
+        with self._lock:
+            response = self._entries.get(key)
+            if response is not None:
+                self._entries.move_to_end(key)
+        
+        if response is None and self.directory:
+            response = self._load(key)
+            if response is not None:
+                self._remember(key, response)
+        return response
+    
+    def put(self, key: str, response: Dict[str, Any]) -> None:
+        """Store an entry under key."""
+        self._remember(key, response)
+        if self.directory:
+            self._store(key, response)
+    
+    def clear(self) -> None:
+        """Drop the in-memory entries and reset the counters; files on disk are kept."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+            self.structural_hits = 0
+    
+    def stats(self) -> Dict[str, int]:
+        """Return hit/miss counters and the number of in-memory entries."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "structural_hits": self.structural_hits,
+                "entries": len(self._entries),
+            }
+    
+    def _remember(self, key: str, response: Dict[str, Any]) -> None:
+        with self._lock:
+            self._entries[key] = response
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+    
+    def _load(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._path(key), 'rb') as f:
+                return jsonutil.loads(f.read())
+        except (OSError, jsonutil.JSONDecodeError):
+            return None
+    
+    def _store(self, key: str, response: Dict[str, Any]) -> None:
+        # Write to a temp file and rename, so concurrent readers never see a partial entry.
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(jsonutil.dumps_bytes(response))
+            os.replace(tmp_path, path)
+        except OSError:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
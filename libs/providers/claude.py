@@ -4,18 +4,20 @@ Claude Provider
 Implements the Anthropic Claude API.
 """
 
-import json
-import urllib.request
-import urllib.error
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, Iterator, List, Optional
 
 from libs.providers.base import BaseProvider, ProviderError
 
 
+# Roles passed through to the Messages API; system messages go in "system".
+_CLAUDE_ROLES = frozenset({"user", "assistant"})
+
+
 class ClaudeProvider(BaseProvider):
     """Claude provider via Anthropic API."""
     
     name = "claude"
+    api_name = "Claude"
     default_model = "claude-sonnet-4-20250514"
     default_base_url = "https://api.anthropic.com/v1"
     max_output_tokens = 16384
@@ -29,6 +31,11 @@ class ClaudeProvider(BaseProvider):
     ):
         super().__init__(api_key, model, base_url, **kwargs)
         self.base_url = (base_url or self.default_base_url).rstrip('/')
+        self._headers = {
+            'x-api-key': self.api_key,
+            'anthropic-version': '2023-06-01',
+            'Content-Type': 'application/json'
+        }
     
     def _convert_messages_to_claude_format(
         self,
@@ -39,33 +46,28 @@ class ClaudeProvider(BaseProvider):
         
         Claude expects a separate 'system' message and messages without 'system' role.
         """
-        system_prompt = ""
-        claude_messages = []
-        
-        for msg in messages:
-            role = msg.get("role", "")
-            content = msg.get("content", "")
-            
-            if role == "system":
-                system_prompt = content
-            elif role in ("user", "assistant"):
-                claude_messages.append({
-                    "role": role,
-                    "content": content
-                })
+        # Scan from the end: with several system messages the last one wins.
+        system_prompt = next(
+            (m["content"] for m in reversed(messages) if m.get("role") == "system"),
+            ""
+        )
+        # Messages that are already just role and content are passed through
+        # unchanged, so their encoded bytes stay cached across calls.
+        claude_messages = [
+            m if len(m) == 2 and "content" in m else {"role": m["role"], "content": m["content"]}
+            for m in messages if m.get("role") in _CLAUDE_ROLES
+        ]
         
         return system_prompt, claude_messages
     
-    def chat(
+    def _build_payload(
         self,
         messages: List[Dict[str, Any]],
         temperature: float = 0.7,
         max_tokens: int = 8192,
         **kwargs
     ) -> Dict[str, Any]:
-        """Send chat completion request to Claude API."""
-        
-        url = f"{self.base_url}/messages"
+        """Build the Messages API request body from OpenAI-style messages."""
         
         system_prompt, claude_messages = self._convert_messages_to_claude_format(messages)
         
@@ -86,57 +88,51 @@ class ClaudeProvider(BaseProvider):
                 if key not in payload:
                     payload[key] = value
         
-        data = json.dumps(payload).encode('utf-8')
+        return payload
+    
+    def _chat(
+        self,
+        messages: List[Dict[str, Any]],
+        temperature: float = 0.7,
+        max_tokens: int = 8192,
+        **kwargs
+    ) -> Dict[str, Any]:
+        """Send chat completion request to Claude API."""
         
-        req = urllib.request.Request(
-            url,
-            data=data,
-            method='POST',
-            headers={
-                'x-api-key': self.api_key,
-                'anthropic-version': '2023-06-01',
-                'Content-Type': 'application/json'
-            }
-        )
+        path = f"{self._url_parts.path}/messages"
+        payload = self._build_payload(messages, temperature, max_tokens, **kwargs)
+        result = self._post_json(path, payload, self._headers)
         
         try:
-            with urllib.request.urlopen(req, timeout=120) as response:
-                response_data = response.read().decode('utf-8')
-                result = json.loads(response_data)
-                
-                if "content" in result and len(result["content"]) > 0:
-                    content = result["content"][0].get("text", "")
-                    return {
-                        "content": content,
-                        "raw": result,
-                        "model": self.model
-                    }
-                else:
-                    raise ProviderError(
-                        "No response from Claude",
-                        provider=self.name,
-                        raw_error=result
-                    )
-                    
-        except urllib.error.HTTPError as e:
-            error_body = e.read().decode('utf-8') if e.fp else 'No body'
-            raise ProviderError(
-                f"Claude API error: {e.code} - {error_body}",
-                provider=self.name,
-                raw_error=e
-            )
-        except json.JSONDecodeError as e:
+            content = result["content"][0].get("text") or ""
+        except (KeyError, IndexError, TypeError, AttributeError):
             raise ProviderError(
-                f"Invalid JSON response from Claude: {e}",
+                "No response from Claude",
                 provider=self.name,
-                raw_error=e
-            )
-        except Exception as e:
-            raise ProviderError(
-                f"Claude request failed: {e}",
-                provider=self.name,
-                raw_error=e
-            )
+                raw_error=result
+            ) from None
+        return {
+            "content": content,
+            "raw": result,
+            "model": self.model
+        }
+    
+    def chat_stream(
+        self,
+        messages: List[Dict[str, Any]],
+        temperature: float = 0.7,
+        max_tokens: int = 8192,
+        **kwargs
+    ) -> Iterator[str]:
+        """Stream a chat completion from Claude API, yielding text deltas."""
+        
+        path = f"{self._url_parts.path}/messages"
+        payload = self._build_payload(messages, temperature, max_tokens, **kwargs)
+        for event in self._post_stream(path, payload, self._headers):
+            if event.get("type") == "content_block_delta":
+                text = event.get("delta", {}).get("text")
+                if text:
+                    yield text
     
     def get_model_name(self) -> str:
         return self.model
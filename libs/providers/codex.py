@@ -4,10 +4,7 @@ Codex Provider
 Implements the OpenAI API for GPT-4/Codex models.
 """
 
-import json
-import urllib.request
-import urllib.error
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, Iterator, List, Optional
 
 from libs.providers.base import BaseProvider, ProviderError
 
@@ -16,6 +13,7 @@ class CodexProvider(BaseProvider):
     """Codex/GPT-4 provider via OpenAI API."""
     
     name = "codex"
+    api_name = "OpenAI"
     default_model = "gpt-4"
     default_base_url = "https://api.openai.com/v1"
     max_output_tokens = 16384
@@ -29,17 +27,19 @@ class CodexProvider(BaseProvider):
     ):
         super().__init__(api_key, model, base_url, **kwargs)
         self.base_url = (base_url or self.default_base_url).rstrip('/')
+        self._headers = {
+            'Authorization': f'Bearer {self.api_key}',
+            'Content-Type': 'application/json'
+        }
     
-    def chat(
+    def _build_payload(
         self,
         messages: List[Dict[str, Any]],
         temperature: float = 0.7,
         max_tokens: int = 8192,
         **kwargs
     ) -> Dict[str, Any]:
-        """Send chat completion request to OpenAI API."""
-        
-        url = f"{self.base_url}/chat/completions"
+        """Build the chat completion request body."""
         
         payload = {
             "model": self.model,
@@ -51,56 +51,52 @@ class CodexProvider(BaseProvider):
         if kwargs:
             payload.update(kwargs)
         
-        data = json.dumps(payload).encode('utf-8')
+        return payload
+    
+    def _chat(
+        self,
+        messages: List[Dict[str, Any]],
+        temperature: float = 0.7,
+        max_tokens: int = 8192,
+        **kwargs
+    ) -> Dict[str, Any]:
+        """Send chat completion request to OpenAI API."""
         
-        req = urllib.request.Request(
-            url,
-            data=data,
-            method='POST',
-            headers={
-                'Authorization': f'Bearer {self.api_key}',
-                'Content-Type': 'application/json'
-            }
-        )
+        path = f"{self._url_parts.path}/chat/completions"
+        payload = self._build_payload(messages, temperature, max_tokens, **kwargs)
+        result = self._post_json(path, payload, self._headers)
         
         try:
-            with urllib.request.urlopen(req, timeout=120) as response:
-                response_data = response.read().decode('utf-8')
-                result = json.loads(response_data)
-                
-                if "choices" in result and len(result["choices"]) > 0:
-                    content = result["choices"][0].get("message", {}).get("content", "")
-                    return {
-                        "content": content,
-                        "raw": result,
-                        "model": self.model
-                    }
-                else:
-                    raise ProviderError(
-                        "No response from OpenAI",
-                        provider=self.name,
-                        raw_error=result
-                    )
-                    
-        except urllib.error.HTTPError as e:
-            error_body = e.read().decode('utf-8') if e.fp else 'No body'
+            content = result["choices"][0]["message"].get("content") or ""
+        except (KeyError, IndexError, TypeError, AttributeError):
             raise ProviderError(
-                f"OpenAI API error: {e.code} - {error_body}",
+                "No response from OpenAI",
                 provider=self.name,
-                raw_error=e
-            )
-        except json.JSONDecodeError as e:
-            raise ProviderError(
-                f"Invalid JSON response from OpenAI: {e}",
-                provider=self.name,
-                raw_error=e
-            )
-        except Exception as e:
-            raise ProviderError(
-                f"OpenAI request failed: {e}",
-                provider=self.name,
-                raw_error=e
-            )
+                raw_error=result
+            ) from None
+        return {
+            "content": content,
+            "raw": result,
+            "model": self.model
+        }
+    
+    def chat_stream(
+        self,
+        messages: List[Dict[str, Any]],
+        temperature: float = 0.7,
+        max_tokens: int = 8192,
+        **kwargs
+    ) -> Iterator[str]:
+        """Stream a chat completion from OpenAI API, yielding content deltas."""
+        
+        path = f"{self._url_parts.path}/chat/completions"
+        payload = self._build_payload(messages, temperature, max_tokens, **kwargs)
+        for event in self._post_stream(path, payload, self._headers):
+            choices = event.get("choices")
+            if choices:
+                content = choices[0].get("delta", {}).get("content")
+                if content:
+                    yield content
     
     def get_model_name(self) -> str:
         return self.model
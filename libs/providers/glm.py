@@ -4,11 +4,7 @@ GLM Provider
 Implements the Z.AI GLM API (supports glm-4.7, glm-5, etc).
 """
 
-import json
-import time
-import urllib.request
-import urllib.error
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, Iterator, List, Optional
 
 from libs.providers.base import BaseProvider, ProviderError
 
@@ -17,11 +13,10 @@ class GLMProvider(BaseProvider):
     """GLM provider via Z.AI API (supports glm-4.7, glm-5)."""
 
     name = "glm"
+    api_name = "GLM"
     default_model = "glm-5"
     default_base_url = "https://api.z.ai/api/coding/paas/v4"
     max_output_tokens = 32768
-    max_retries = 3
-    retry_delay = 2
 
     def __init__(
         self,
@@ -32,82 +27,23 @@ class GLMProvider(BaseProvider):
     ):
         super().__init__(api_key, model, base_url, **kwargs)
         self.base_url = (base_url or self.default_base_url).rstrip('/')
+        self._headers = {
+            'Authorization': f'Bearer {self.api_key}',
+            'Content-Type': 'application/json'
+        }
 
-    def _make_request(
-        self,
-        url: str,
-        data: bytes,
-        headers: Dict[str, str],
-        timeout: int = 120
-    ) -> Dict[str, Any]:
-        """Make HTTP request with retry logic."""
-
-        last_error = None
-
-        for attempt in range(self.max_retries):
-            try:
-                req = urllib.request.Request(
-                    url,
-                    data=data,
-                    method='POST',
-                    headers=headers
-                )
-
-                with urllib.request.urlopen(req, timeout=timeout) as response:
-                    response_data = response.read().decode('utf-8')
-                    return json.loads(response_data)
-
-            except urllib.error.HTTPError as e:
-                error_body = e.read().decode('utf-8') if e.fp else 'No body'
-
-                if e.code >= 500 or e.code == 429:
-                    last_error = f"GLM API error: {e.code} - {error_body}"
-                    if attempt < self.max_retries - 1:
-                        wait_time = self.retry_delay * (2 ** attempt)
-                        print(f"[GLM] Retryable error {e.code}, waiting {wait_time}s...")
-                        time.sleep(wait_time)
-                        continue
-                raise ProviderError(
-                    f"GLM API error: {e.code} - {error_body}",
-                    provider=self.name,
-                    raw_error=e
-                )
-
-            except (urllib.error.URLError, ConnectionError, TimeoutError, OSError) as e:
-                last_error = str(e)
-                if attempt < self.max_retries - 1:
-                    wait_time = self.retry_delay * (2 ** attempt)
-                    print(f"[GLM] Connection error: {e}, retrying in {wait_time}s...")
-                    time.sleep(wait_time)
-                    continue
-
-            except json.JSONDecodeError as e:
-                raise ProviderError(
-                    f"Invalid JSON response from GLM: {e}",
-                    provider=self.name,
-                    raw_error=e
-                )
-
-        raise ProviderError(
-            f"GLM request failed after {self.max_retries} retries: {last_error}",
-            provider=self.name,
-            raw_error=last_error
-        )
-
-    def chat(
+    def _build_payload(
         self,
         messages: List[Dict[str, Any]],
         temperature: float = 0.7,
         max_tokens: int = None,
         **kwargs
     ) -> Dict[str, Any]:
-        """Send chat completion request to GLM API."""
+        """Build the chat completion request body."""
 
         if max_tokens is None:
             max_tokens = self.max_output_tokens
 
-        url = f"{self.base_url}/chat/completions"
-
         payload = {
             "model": self.model,
             "messages": messages,
@@ -118,31 +54,55 @@ class GLMProvider(BaseProvider):
         if kwargs:
             payload.update(kwargs)
 
-        data = json.dumps(payload).encode('utf-8')
+        return payload
 
-        headers = {
-            'Authorization': f'Bearer {self.api_key}',
-            'Content-Type': 'application/json'
-        }
+    def _chat(
+        self,
+        messages: List[Dict[str, Any]],
+        temperature: float = 0.7,
+        max_tokens: int = None,
+        **kwargs
+    ) -> Dict[str, Any]:
+        """Send chat completion request to GLM API."""
+
+        path = f"{self._url_parts.path}/chat/completions"
+        payload = self._build_payload(messages, temperature, max_tokens, **kwargs)
+        result = self._post_json(path, payload, self._headers)
 
-        result = self._make_request(url, data, headers)
-
-        if "choices" in result and len(result["choices"]) > 0:
-            message = result["choices"][0].get("message", {})
-            content = message.get("content", "")
-            reasoning = message.get("reasoning_content", "")
-            return {
-                "content": content,
-                "reasoning": reasoning,
-                "raw": result,
-                "model": self.model
-            }
-        else:
+        try:
+            message = result["choices"][0]["message"]
+            content = message.get("content") or ""
+            reasoning = message.get("reasoning_content") or ""
+        except (KeyError, IndexError, TypeError, AttributeError):
             raise ProviderError(
                 "No response from GLM",
                 provider=self.name,
                 raw_error=result
-            )
+            ) from None
+        return {
+            "content": content,
+            "reasoning": reasoning,
+            "raw": result,
+            "model": self.model
+        }
+
+    def chat_stream(
+        self,
+        messages: List[Dict[str, Any]],
+        temperature: float = 0.7,
+        max_tokens: int = None,
+        **kwargs
+    ) -> Iterator[str]:
+        """Stream a chat completion from GLM API, yielding content deltas."""
+
+        path = f"{self._url_parts.path}/chat/completions"
+        payload = self._build_payload(messages, temperature, max_tokens, **kwargs)
+        for event in self._post_stream(path, payload, self._headers):
+            choices = event.get("choices")
+            if choices:
+                content = choices[0].get("delta", {}).get("content")
+                if content:
+                    yield content
 
     def get_model_name(self) -> str:
         return self.model
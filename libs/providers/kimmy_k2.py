@@ -28,7 +28,7 @@ class KimmyK2Provider(BaseProvider):
         super().__init__(api_key, model, base_url, **kwargs)
         self.base_url = (base_url or self.default_base_url).rstrip('/')
     
-    def chat(
+    def _chat(
         self,
         messages: List[Dict[str, Any]],
         temperature: float = 0.7,
@@ -10,7 +10,10 @@ from libs.tools.tools import (
     glob_search,
     grep_search,
     bash_command,
+    bash_command_async,
     list_files,
+    clear_cache,
+    reload_project_root,
 )
 
 __all__ = [
@@ -21,5 +24,8 @@ __all__ = [
     "glob_search",
     "grep_search",
     "bash_command",
+    "bash_command_async",
     "list_files",
+    "clear_cache",
+    "reload_project_root",
 ]
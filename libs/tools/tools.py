@@ -6,29 +6,181 @@ and execute commands.
 """
 
 import os
+import io
 import re
+import sys
 import json
+import time
+import signal
+import asyncio
+import base64
+import shutil
+import mmap
+import stat
+import fnmatch
+import functools
+import selectors
+import threading
 import subprocess
+import itertools
 import glob as glob_module
-from typing import Dict, Any, List, Optional, Callable
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from types import MappingProxyType
+from typing import Dict, Any, List, Optional, Callable, Iterable, Mapping, NamedTuple, Tuple, Union
 
+from libs import jsonutil
 
+
+# Below this many candidate files, starting worker processes costs more than it saves.
+GREP_PARALLEL_MIN_FILES = 64
+# Files handed to a grep worker at a time; their reads are hinted to the kernel together.
+GREP_BATCH_SIZE = 32
+# Use ripgrep for grep_search when an `rg` binary is on PATH.
+GREP_USE_RIPGREP = True
+# Directories grep_search never descends into.
+GREP_SKIP_DIRS = frozenset({'.git', 'node_modules', '__pycache__'})
+# Binary file types a grep with the default include="*" skips without opening.
+GREP_SKIP_EXTENSIONS = frozenset({
+    '.png', '.jpg', '.jpeg', '.gif', '.bmp', '.ico', '.webp',
+    '.pdf', '.zip', '.gz', '.tgz', '.bz2', '.xz', '.7z', '.tar', '.jar', '.whl',
+    '.so', '.dylib', '.dll', '.exe', '.o', '.a', '.pyc', '.pyo', '.class',
+    '.woff', '.woff2', '.ttf', '.otf', '.eot',
+    '.mp3', '.mp4', '.mov', '.avi', '.wav', '.sqlite', '.db', '.bin',
+})
+# Threads grep_search scans with when it cannot use worker processes.
+GREP_MAX_THREADS = min(32, (os.cpu_count() or 1) * 2)
+# Upper bound on threads used to expand several glob patterns at once.
+GLOB_MAX_WORKERS = 16
+# Files of at least this size are memory-mapped by read_file and grep rather than read().
+MMAP_MIN_BYTES = 1024 * 1024
+# Files with a NUL byte in this many leading bytes are treated as binary and skipped.
+BINARY_SNIFF_BYTES = 8192
+# _atomic_write hands data to os.write in slices of this size.
+WRITE_CHUNK_SIZE = 1024 * 1024
+# bash_command keeps at most this many trailing bytes of stdout and of stderr.
+BASH_OUTPUT_LIMIT = 1024 * 1024
+
+# Number of directory listings list_files keeps cached.
+LISTDIR_CACHE_SIZE = 256
+# Directories modified more recently than this are not cached: a second change
+# within the filesystem's timestamp granularity would leave st_mtime_ns unchanged.
+LISTDIR_SETTLE_NS = 1_000_000_000
+# Files up to this size are edited in memory; larger ones through mmap.
+EDIT_IN_MEMORY_MAX_BYTES = 1024 * 1024
+# Contents of recently written files kept for read_file, and the largest file kept.
+READ_CACHE_SIZE = 32
+READ_CACHE_MAX_BYTES = 1024 * 1024
+
+_FADV_WILLNEED = getattr(os, 'POSIX_FADV_WILLNEED', None)
+
+# abspath -> (st_mtime_ns, ((name, is_dir), ...)), least recently used first.
+_listdir_cache: "OrderedDict[str, Tuple[int, Tuple[Tuple[str, bool], ...]]]" = OrderedDict()
+_listdir_lock = threading.Lock()
+
+# realpath -> ((st_ino, st_mtime_ns, st_size), content), least recently used first.
+_read_cache: "OrderedDict[str, Tuple[Tuple[int, int, int], str]]" = OrderedDict()
+_read_lock = threading.Lock()
+
+
+def clear_cache():
+    """Drop all cached directory listings and file contents."""
+    with _listdir_lock:
+        _listdir_cache.clear()
+    with _read_lock:
+        _read_cache.clear()
+
+
+def _file_key(st: os.stat_result) -> Tuple[int, int, int]:
+    """Identity of a file version: atomic writes change the inode, edits in place the mtime or size."""
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+def _remember_contents(file_path: str, content: Optional[str]):
+    """
+    Cache content as what read_file would return for file_path right now.
+    
+    The agent commonly reads back a file it has just written or edited, so the
+    write paths store the text they already have in memory. Passing None drops
+    the entry instead.
+    """
+    target = os.path.realpath(file_path)
+    with _read_lock:
+        _read_cache.pop(target, None)
+        if content is None or len(content) > READ_CACHE_MAX_BYTES:
+            return
+        try:
+            key = _file_key(os.stat(target))
+        except OSError:
+            return
+        if '\r' in content:
+            # Match read_file's universal-newline text mode.
+            content = content.replace('\r\n', '\n').replace('\r', '\n')
+        _read_cache[target] = (key, content)
+        while len(_read_cache) > READ_CACHE_SIZE:
+            _read_cache.popitem(last=False)
+
+
+def _invalidate_listing(file_path: str):
+    """Forget the cached listing of the directory containing file_path."""
+    parents = {
+        os.path.dirname(os.path.abspath(file_path)),
+        os.path.dirname(os.path.realpath(file_path)),
+    }
+    with _listdir_lock:
+        for parent in parents:
+            _listdir_cache.pop(parent, None)
+
+
+@functools.lru_cache(maxsize=1)
 def get_project_root() -> str:
-    """Get the project root directory."""
+    """
+    Get the project root directory.
+    
+    Read from PROJECT_ROOT (default: the working directory) on first use and
+    cached; call reload_project_root() after changing either.
+    """
     return os.environ.get('PROJECT_ROOT', os.getcwd())
 
 
+@functools.lru_cache(maxsize=1)
+def _project_root_prefix() -> Tuple[str, str]:
+    """The project root with symlinks resolved, and that root with a trailing separator."""
+    root = os.path.realpath(get_project_root())
+    return root, root if root.endswith(os.sep) else root + os.sep
+
+
+def reload_project_root():
+    """Re-read the project root, e.g. after PROJECT_ROOT or the working directory changed."""
+    get_project_root.cache_clear()
+    _project_root_prefix.cache_clear()
+
+
 def is_within_project(file_path: str) -> bool:
-    """Check if a file path is within the project directory."""
-    project_root = get_project_root()
-    abs_file_path = os.path.abspath(file_path)
-    abs_project_root = os.path.abspath(project_root)
+    """
+    Check if a file path is within the project directory.
     
-    try:
-        os.path.relpath(abs_file_path, abs_project_root)
-        return True
-    except ValueError:
-        return False
+    Symlinks are resolved first, as _atomic_write does before writing, so a
+    link inside the project that points elsewhere does not pass.
+    """
+    root, prefix = _project_root_prefix()
+    real_path = os.path.realpath(file_path)
+    return real_path == root or real_path.startswith(prefix)
+
+
+# Tool reference returned by ToolRegistry.get_tool_descriptions.
+TOOL_DESCRIPTIONS = """
+Available tools:
+- read(file_path): Read file contents
+- write(file_path, content): Write content to file (restricted to project directory)
+- edit(file_path, old_string, new_string, replace_all=False): Edit file (restricted to project directory)
+- glob(pattern, path=".", limit=None): Find files matching pattern (or a list of patterns), at most limit
+- grep(pattern, path=".", include="*"): Search in files (skips .git, node_modules, __pycache__); returns parallel files/lines/snippets lists
+- bash(command, timeout=120000): Execute bash command
+- list_files(path="."): List directory contents
+
+NOTE: write_file and edit_file can only modify files within the project directory."""
 
 
 class ToolRegistry:
@@ -40,15 +192,7 @@ class ToolRegistry:
     
     def _register_defaults(self):
         """Register default tools."""
-        self._tools = {
-            "read": read_file,
-            "write": write_file,
-            "edit": edit_file,
-            "glob": glob_search,
-            "grep": grep_search,
-            "bash": bash_command,
-            "list_files": list_files,
-        }
+        self._tools = dict(_DEFAULT_TOOLS)
     
     def register(self, name: str, func: Callable):
         """Register a new tool."""
@@ -58,28 +202,34 @@ class ToolRegistry:
         """Get a tool by name."""
         return self._tools.get(name)
     
+    def dispatch_table(self) -> Dict[str, Callable]:
+        """Return the live name -> function mapping, for callers that look tools up in a hot loop."""
+        return self._tools
+    
     def list_tools(self) -> List[str]:
         """List available tool names."""
         return list(self._tools.keys())
     
     def get_tool_descriptions(self) -> str:
         """Get formatted descriptions of all tools."""
-        return """
-Available tools:
-- read(file_path): Read file contents
-- write(file_path, content): Write content to file (restricted to project directory)
-- edit(file_path, old_string, new_string, replace_all=False): Edit file (restricted to project directory)
-- glob(pattern, path="."): Find files matching pattern
-- grep(pattern, path=".", include="*"): Search in files
-- bash(command, timeout=120000): Execute bash command
-- list_files(path="."): List directory contents
-
-NOTE: write_file and edit_file can only modify files within the project directory."""
+        return TOOL_DESCRIPTIONS
 
 
 def read_file(file_path: str) -> Dict[str, Any]:
     """Read file contents."""
     try:
+        target = os.path.realpath(file_path)
+        with _read_lock:
+            cached = _read_cache.get(target)
+        if cached is not None and cached[0] == _file_key(os.stat(target)):
+            with _read_lock:
+                if target in _read_cache:
+                    _read_cache.move_to_end(target)
+            return {"success": True, "content": cached[1], "file": file_path}
+        
+        if os.stat(file_path).st_size >= MMAP_MIN_BYTES:
+            return {"success": True, "content": _read_mapped(file_path), "file": file_path}
+        
         with open(file_path, 'r', encoding='utf-8') as f:
             content = f.read()
         return {"success": True, "content": content, "file": file_path}
@@ -87,8 +237,18 @@ def read_file(file_path: str) -> Dict[str, Any]:
         return {"success": False, "error": str(e)}
 
 
+def _read_mapped(file_path: str) -> str:
+    """Decode a file through mmap, with the same newline handling as text mode."""
+    with open(file_path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            content = str(mm, 'utf-8')
+    if '\r' in content:
+        content = content.replace('\r\n', '\n').replace('\r', '\n')
+    return content
+
+
 def write_file(file_path: str, content: str) -> Dict[str, Any]:
-    """Write content to file."""
+    """Write content to file, atomically replacing any existing file."""
     try:
         # Validate file is within project directory
         if not is_within_project(file_path):
@@ -101,20 +261,86 @@ def write_file(file_path: str, content: str) -> Dict[str, Any]:
         dir_path = os.path.dirname(file_path)
         if dir_path:
             os.makedirs(dir_path, exist_ok=True)
-        with open(file_path, 'w', encoding='utf-8') as f:
-            f.write(content)
+        try:
+            mode = stat.S_IMODE(os.stat(file_path).st_mode)
+        except FileNotFoundError:
+            mode = None
+        _atomic_write(file_path, (content.encode('utf-8'),), mode)
+        _invalidate_listing(file_path)
+        _remember_contents(file_path, content)
         return {"success": True, "message": f"Written to {file_path}", "bytes": len(content)}
     except Exception as e:
         return {"success": False, "error": str(e)}
 
 
+def _atomic_write(file_path: str, chunks: Iterable[bytes], mode: Optional[int] = None) -> None:
+    """
+    Write chunks to a temp file next to file_path, then rename it over the original.
+    
+    Data is written with os.write in WRITE_CHUNK_SIZE slices of each chunk and
+    fsynced before the rename, so neither readers nor a crash can observe a
+    partially written file. The temp file is created with the usual
+    0o666 & ~umask permissions; pass mode to keep an existing file's.
+    """
+    target = os.path.realpath(file_path)
+    dir_path, name = os.path.split(target)
+    flags = os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0)
+    while True:
+        tmp_path = os.path.join(dir_path, f".{name}.{os.urandom(4).hex()}.tmp")
+        try:
+            fd = os.open(tmp_path, flags, 0o666)
+            break
+        except FileExistsError:
+            continue
+    
+    try:
+        try:
+            for chunk in chunks:
+                view = memoryview(chunk)
+                while view:
+                    written = os.write(fd, view[:WRITE_CHUNK_SIZE])
+                    view = view[written:]
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        if mode is not None:
+            os.chmod(tmp_path, mode)
+        os.replace(tmp_path, target)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def _find_all(buf, needle: bytes) -> List[int]:
+    """Return start offsets of non-overlapping occurrences of needle in buf."""
+    positions = []
+    pos = buf.find(needle)
+    while pos != -1:
+        positions.append(pos)
+        pos = buf.find(needle, pos + len(needle))
+    return positions
+
+
+def _replaced_chunks(view: memoryview, positions: List[int], old_len: int, new_bytes: bytes) -> Iterable:
+    """Yield slices of view with the old_len bytes at each position replaced by new_bytes."""
+    last = 0
+    for pos in positions:
+        yield view[last:pos]
+        yield new_bytes
+        last = pos + old_len
+    yield view[last:]
+
+
 def edit_file(
     file_path: str,
     old_string: str,
     new_string: str,
     replace_all: bool = False
 ) -> Dict[str, Any]:
-    """Edit file by replacing text."""
+    """Edit file by replacing text; the file is replaced atomically."""
     try:
         # Validate file is within project directory
         if not is_within_project(file_path):
@@ -124,103 +350,758 @@ def edit_file(
                 "error": f"Cannot edit file outside project directory. File: {file_path}, Project root: {project_root}"
             }
         
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
+        if not old_string:
+            return {"success": False, "error": "old_string must not be empty"}
         
-        count = content.count(old_string)
-        if count == 0:
-            return {"success": False, "error": "old_string not found in file"}
+        old_bytes = old_string.encode('utf-8')
+        new_bytes = new_string.encode('utf-8')
         
-        if count > 1 and not replace_all:
-            return {"success": False, "error": f"old_string found {count} times, use replace_all=true"}
+        def use_crlf(buf) -> bool:
+            # Files with CRLF line endings: match a multi-line old_string
+            # against the file's own line endings and keep them.
+            nonlocal old_bytes, new_bytes
+            if b'\n' not in old_bytes or buf.find(b'\r\n') == -1:
+                return False
+            old_bytes = old_bytes.replace(b'\n', b'\r\n')
+            new_bytes = new_bytes.replace(b'\n', b'\r\n')
+            return True
         
-        if replace_all:
-            new_content = content.replace(old_string, new_string)
-        else:
-            new_content = content.replace(old_string, new_string, 1)
+        def check(count: int) -> Optional[Dict[str, Any]]:
+            if count == 0:
+                return {"success": False, "error": "old_string not found in file"}
+            if count > 1 and not replace_all:
+                return {"success": False, "error": f"old_string found {count} times, use replace_all=true"}
+            return None
+        
+        data = None
+        with open(file_path, 'rb') as f:
+            st = os.fstat(f.fileno())
+            if st.st_size == 0:
+                return {"success": False, "error": "old_string not found in file"}
+            mode = st.st_mode & 0o7777
+            
+            if st.st_size <= EDIT_IN_MEMORY_MAX_BYTES:
+                data = f.read()
+            else:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    positions = _find_all(mm, old_bytes)
+                    if not positions and use_crlf(mm):
+                        positions = _find_all(mm, old_bytes)
+                    count = len(positions)
+                    error = check(count)
+                    if error:
+                        return error
+                    with memoryview(mm) as view:
+                        _atomic_write(file_path, _replaced_chunks(view, positions, len(old_bytes), new_bytes), mode)
         
-        with open(file_path, 'w', encoding='utf-8') as f:
-            f.write(new_content)
+        contents = None
+        if data is not None:
+            # Without replace_all a second match is already an error, so stop there.
+            maxsplit = -1 if replace_all else 2
+            parts = data.split(old_bytes, maxsplit)
+            if len(parts) == 1 and use_crlf(data):
+                parts = data.split(old_bytes, maxsplit)
+            count = len(parts) - 1
+            if count > 1 and not replace_all:
+                count = data.count(old_bytes)
+            error = check(count)
+            if error:
+                return error
+            
+            data = new_bytes.join(parts)
+            _atomic_write(file_path, (data,), mode)
+            try:
+                contents = data.decode('utf-8')
+            except UnicodeDecodeError:
+                pass
+        _invalidate_listing(file_path)
+        _remember_contents(file_path, contents)
         
         return {"success": True, "message": f"Replaced {count} occurrence(s) in {file_path}"}
     except Exception as e:
         return {"success": False, "error": str(e)}
 
 
-def glob_search(pattern: str, path: str = ".") -> Dict[str, Any]:
-    """Find files matching pattern."""
+# A recursive glob whose last component is the only one with wildcards, e.g. "**/*.py".
+_RECURSIVE_NAME_GLOB_RE = re.compile(r'\*\*/([^/]+)')
+
+
+def _iter_recursive_glob(directory: str, name_re: "re.Pattern[str]") -> Iterable[str]:
+    """
+    Lazily yield what glob(os.path.join(directory, "**", name)) would.
+    
+    Walks with os.scandir and hides dot entries like glob does. Symlinked
+    directories are followed like glob follows them, except into a directory
+    that is already one of the current path's ancestors, so link cycles
+    terminate.
+    """
+    try:
+        st = os.stat(directory or os.curdir)
+    except OSError:
+        return
+    # Entries are (path, (st_dev, st_ino) of that directory and its ancestors).
+    stack = [(directory, frozenset({(st.st_dev, st.st_ino)}))]
+    while stack:
+        current, ancestors = stack.pop()
+        try:
+            with os.scandir(current or os.curdir) as it:
+                entries = list(it)
+        except OSError:
+            continue
+        
+        subdirs = []
+        for entry in entries:
+            if entry.name.startswith('.'):
+                continue
+            entry_path = os.path.join(current, entry.name)
+            if name_re.match(entry.name):
+                yield entry_path
+            try:
+                if not entry.is_dir():
+                    continue
+                st = entry.stat()
+            except OSError:
+                continue
+            key = (st.st_dev, st.st_ino)
+            if key not in ancestors:
+                subdirs.append((entry_path, ancestors | {key}))
+        
+        stack.extend(reversed(subdirs))
+
+
+def _iter_glob(pattern: str, path: str) -> Iterable[str]:
+    """Lazily expand one glob pattern relative to path."""
+    match = _RECURSIVE_NAME_GLOB_RE.fullmatch(pattern)
+    if (match and not match.group(1).startswith('.')
+            and '**' not in match.group(1) and not glob_module.has_magic(path)):
+        return _iter_recursive_glob(path, _compile_glob(match.group(1)))
+    return glob_module.iglob(os.path.join(path, pattern), recursive=True)
+
+
+def glob_search(
+    pattern: Union[str, List[str]],
+    path: str = ".",
+    limit: Optional[int] = None
+) -> Dict[str, Any]:
+    """Find files matching pattern, or any of a list of patterns, returning at most limit."""
     try:
-        matches = glob_module.glob(os.path.join(path, pattern), recursive=True)
+        def expand(p: str) -> List[str]:
+            # limit matches per pattern always cover the first limit merged ones.
+            return list(itertools.islice(_iter_glob(p, path), limit))
+        
+        if isinstance(pattern, str):
+            matches = expand(pattern)
+            return {"success": True, "files": matches, "count": len(matches)}
+        
+        if len(pattern) > 1:
+            with ThreadPoolExecutor(max_workers=min(GLOB_MAX_WORKERS, len(pattern))) as executor:
+                per_pattern = list(executor.map(expand, pattern))
+        else:
+            per_pattern = [expand(p) for p in pattern]
+        
+        merged = dict.fromkeys(m for found in per_pattern for m in found)
+        matches = list(itertools.islice(merged, limit))
         return {"success": True, "files": matches, "count": len(matches)}
     except Exception as e:
         return {"success": False, "error": str(e)}
 
 
+@functools.lru_cache(maxsize=128)
+def _compile_pattern(pattern: str) -> "re.Pattern[str]":
+    """Compile a search pattern once per process."""
+    return re.compile(pattern)
+
+
+# Zero-width syntax that can hold at the end of a line searched on its own
+# but fail in the full text, where the next line follows: $, \B and negative
+# lookarounds.
+_LOOKS_PAST_LINE_RE = re.compile(r'\$|\\B|\(\?<?!')
+
+
+@functools.lru_cache(maxsize=128)
+def _compile_glob(include: str) -> "re.Pattern[str]":
+    """Translate a filename glob to a compiled regex once rather than per file."""
+    return re.compile(fnmatch.translate(include))
+
+
+@functools.lru_cache(maxsize=128)
+def _compile_prefilter(pattern: str) -> Optional["re.Pattern[str]"]:
+    """
+    Compile a whole-file prefilter for a per-line search pattern.
+    
+    With re.MULTILINE, a line that matches the pattern usually also yields a
+    match somewhere in the full text, so searching the full text finds every
+    candidate line without iterating the lines in Python. That fails for
+    patterns anchored with \\A or \\Z, which mean "start/end of line" per
+    line, and for patterns that can match a newline together with $, \\B or
+    a negative lookaround: per line, \\s$ matches "abc\\n" across its newline,
+    but in "abc\\ndef" the $ after that newline does not hold. Those patterns
+    get no prefilter.
+    """
+    if '\\A' in pattern or '\\Z' in pattern:
+        return None
+    if not _stays_within_line(pattern) and _LOOKS_PAST_LINE_RE.search(pattern):
+        return None
+    return re.compile(pattern, re.MULTILINE)
+
+
+# Pattern syntax that can match a newline: \s, \W, \D, negated classes,
+# escapes spelling a newline, DOTALL and literal newlines.
+_NEWLINE_SYNTAX_RE = re.compile(r'\\[sWDnxuUN0-7]|\[\^|\(\?[a-zA-Z]*s|\n')
+
+
+@functools.lru_cache(maxsize=128)
+def _stays_within_line(pattern: str) -> bool:
+    """
+    Whether a match of pattern can never include a newline.
+    
+    Then each match in the full text lies inside a single line, so the first
+    full-text match after a line start is on the first matching line. That is
+    not so for e.g. \\s$, which per line matches a trailing newline.
+    Errs on the side of False.
+    """
+    return not _NEWLINE_SYNTAX_RE.search(pattern)
+
+
+# Files containing any of these bytes are scanned as decoded text: non-ASCII
+# bytes, \r (needs newline translation) and \x1c-\x1f (whitespace to str
+# regexes but not to bytes regexes).
+_NOT_PLAIN_ASCII_RE = re.compile(rb'[\x80-\xff\x1c-\x1f\r]')
+
+
+class _GrepScanner(NamedTuple):
+    """Compiled forms of one grep pattern."""
+    regex: "re.Pattern[str]"
+    prefilter: Optional["re.Pattern[str]"]
+    # Set when each match lies within one line (see _stays_within_line).
+    within_line: bool
+    # Equivalent bytes patterns for scanning plain-ASCII files undecoded, or None.
+    bytes_regex: Optional["re.Pattern[bytes]"]
+    bytes_prefilter: Optional["re.Pattern[bytes]"]
+
+
+@functools.lru_cache(maxsize=128)
+def _grep_scanner(pattern: str) -> _GrepScanner:
+    """
+    Compile everything grep needs for a pattern once per process.
+    
+    On ASCII-only text a bytes regex built from an ASCII pattern matches
+    exactly where the str regex does, so such files can be searched without
+    decoding them; only the matching lines are decoded for snippets.
+    """
+    prefilter = _compile_prefilter(pattern)
+    within_line = _stays_within_line(pattern)
+    bytes_regex = bytes_prefilter = None
+    if prefilter is not None and within_line and pattern.isascii():
+        try:
+            bytes_regex = re.compile(pattern.encode('ascii'))
+            bytes_prefilter = re.compile(pattern.encode('ascii'), re.MULTILINE)
+        except re.error:
+            # Syntax only valid for str patterns, such as \u escapes.
+            pass
+    return _GrepScanner(_compile_pattern(pattern), prefilter, within_line, bytes_regex, bytes_prefilter)
+
+
+# Parallel (files, lines, snippets) lists of grep matches.
+GrepColumns = Tuple[List[str], List[int], List[str]]
+
+
+def _candidate_lines(buf, prefilter: "re.Pattern", newline) -> Iterable[Tuple[int, Any]]:
+    """
+    Yield (line number, line) for each line of buf holding a prefilter match.
+    
+    The regex engine finds candidates across the whole buffer (str, bytes or
+    mmap) and only the line each one is on is sliced out, instead of
+    searching every line. Lines keep their trailing newline.
+    """
+    size = len(buf)
+    pos = 0
+    line_num = 1
+    counted = 0
+    while pos < size:
+        match = prefilter.search(buf, pos)
+        if match is None:
+            break
+        start = buf.rfind(newline, pos, match.start()) + 1 or pos
+        if start == size:
+            # An empty match after the final newline; there is no line there.
+            break
+        end = buf.find(newline, match.start())
+        end = size if end == -1 else end + 1
+        if isinstance(buf, mmap.mmap):
+            line_num += buf[counted:start].count(newline)
+        else:
+            line_num += buf.count(newline, counted, start)
+        counted = start
+        yield line_num, buf[start:end]
+        pos = end
+
+
+def _grep_data(
+    file_path: str,
+    data: Union[bytes, mmap.mmap],
+    scanner: _GrepScanner,
+    columns: GrepColumns
+):
+    """Append the matching lines of one file's contents to columns."""
+    if b'\0' in data[:BINARY_SNIFF_BYTES]:
+        return
+    
+    files, lines, snippets = columns
+    if scanner.bytes_prefilter is not None and not _NOT_PLAIN_ASCII_RE.search(data):
+        bytes_regex = scanner.bytes_regex
+        for line_num, line in _candidate_lines(data, scanner.bytes_prefilter, b'\n'):
+            if bytes_regex.search(line):
+                files.append(file_path)
+                lines.append(line_num)
+                snippets.append(line.decode('ascii').strip())
+        return
+    
+    text = str(data, 'utf-8', 'ignore')
+    if '\r' in text:
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+    
+    regex, prefilter = scanner.regex, scanner.prefilter
+    if prefilter is not None and scanner.within_line:
+        for line_num, line in _candidate_lines(text, prefilter, '\n'):
+            if regex.search(line):
+                files.append(file_path)
+                lines.append(line_num)
+                snippets.append(line.strip())
+        return
+    
+    if prefilter is not None and not prefilter.search(text):
+        return
+    
+    for line_num, line in enumerate(io.StringIO(text), 1):
+        if regex.search(line):
+            files.append(file_path)
+            lines.append(line_num)
+            snippets.append(line.strip())
+
+
+def _grep_batch(args: Tuple[List[str], str]) -> GrepColumns:
+    """
+    Scan a batch of files for a pattern. Runs in a grep worker process.
+    
+    Every file in the batch is opened up front and, where supported, hinted
+    with POSIX_FADV_WILLNEED so the kernel reads them into the page cache
+    concurrently while the earlier files are being scanned.
+    """
+    file_paths, pattern = args
+    scanner = _grep_scanner(pattern)
+    
+    opened = []
+    try:
+        for file_path in file_paths:
+            try:
+                fd = os.open(file_path, os.O_RDONLY | os.O_NONBLOCK)
+            except (IOError, OSError, PermissionError):
+                continue
+            opened.append((file_path, fd))
+            if _FADV_WILLNEED is not None:
+                try:
+                    os.posix_fadvise(fd, 0, 0, _FADV_WILLNEED)
+                except OSError:
+                    pass
+        
+        columns: GrepColumns = ([], [], [])
+        for file_path, fd in opened:
+            try:
+                st = os.fstat(fd)
+                # Skip FIFOs, devices and the like, which could block or never end.
+                if not stat.S_ISREG(st.st_mode):
+                    continue
+                if st.st_size >= MMAP_MIN_BYTES:
+                    # Scan straight from the page cache rather than a bytes copy.
+                    with mmap.mmap(fd, 0, access=mmap.ACCESS_READ) as mm:
+                        _grep_data(file_path, mm, scanner, columns)
+                    continue
+                with open(fd, 'rb', closefd=False) as f:
+                    data = f.read()
+            except (IOError, OSError, PermissionError):
+                continue
+            _grep_data(file_path, data, scanner, columns)
+        return columns
+    finally:
+        for _, fd in opened:
+            os.close(fd)
+
+
+def _iter_files(
+    path: str,
+    include_re: "re.Pattern[str]",
+    skip_extensions: frozenset = frozenset()
+) -> Iterable[str]:
+    """
+    Yield files under path whose names match include_re, top-down like os.walk.
+    
+    Walks with an explicit stack of os.scandir listings, so file/directory
+    checks come from the cached d_type rather than a stat() per file, and
+    prunes GREP_SKIP_DIRS and files ending in skip_extensions. Symlinks are
+    followed, as with rg -L, except into a directory that is already an
+    ancestor of the current one. Like ripgrep, a path naming a single file
+    yields that file regardless of include_re.
+    """
+    if os.path.isfile(path):
+        yield path
+        return
+    
+    try:
+        st = os.stat(path)
+    except OSError:
+        return
+    # Entries are (path, (st_dev, st_ino) of that directory and its ancestors).
+    stack = [(path, frozenset({(st.st_dev, st.st_ino)}))]
+    while stack:
+        current, ancestors = stack.pop()
+        try:
+            with os.scandir(current) as it:
+                entries = list(it)
+        except OSError:
+            continue
+        
+        subdirs = []
+        for entry in entries:
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                continue
+            if is_dir:
+                if entry.name in GREP_SKIP_DIRS:
+                    continue
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                key = (st.st_dev, st.st_ino)
+                if key not in ancestors:
+                    subdirs.append((entry.path, ancestors | {key}))
+            elif include_re.match(entry.name):
+                if skip_extensions and os.path.splitext(entry.name)[1].lower() in skip_extensions:
+                    continue
+                yield entry.path
+        
+        # Reversed, so the first subdirectory is popped (and walked) first.
+        stack.extend(reversed(subdirs))
+
+
+@functools.lru_cache(maxsize=1)
+def _ripgrep_path() -> Optional[str]:
+    """Locate the rg binary once per process."""
+    return shutil.which('rg')
+
+
+def _rg_text(field: Dict[str, Any]) -> str:
+    """Decode a ripgrep --json text field, which is base64 bytes when not valid UTF-8."""
+    if 'text' in field:
+        return field['text']
+    return base64.b64decode(field.get('bytes', '')).decode('utf-8', errors='ignore')
+
+
+def _ripgrep_search(rg: str, pattern: str, path: str, include: str) -> Optional[GrepColumns]:
+    """
+    Run the search with ripgrep and collect its --json output.
+    
+    Flags mirror the Python scanner: ignore files and hidden-file rules are
+    off, symlinks are followed, $ matches before \\r\\n, GREP_SKIP_DIRS are
+    excluded, and so are GREP_SKIP_EXTENSIONS when include is "*". Returns
+    None when rg did not complete the search (for example, a pattern using
+    Python-only syntax such as lookaround), so the caller can fall back to
+    the Python scanner.
+    """
+    cmd = [
+        rg, '--json', '--no-config', '--no-ignore', '--hidden', '--follow', '--crlf',
+        '--no-messages', '--glob', include
+    ]
+    for skip_dir in sorted(GREP_SKIP_DIRS):
+        cmd += ['--glob', f'!{skip_dir}']
+    if include == '*':
+        for extension in sorted(GREP_SKIP_EXTENSIONS):
+            cmd += ['--iglob', f'!*{extension}']
+    cmd += ['-e', pattern, '--', path]
+    
+    try:
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    except OSError:
+        return None
+    
+    files, lines, snippets = columns = ([], [], [])
+    completed = False
+    with proc:
+        last_path = None
+        for raw in proc.stdout:
+            message = jsonutil.loads(raw)
+            kind = message.get('type')
+            if kind == 'match':
+                data = message['data']
+                file_path = _rg_text(data['path'])
+                if file_path == last_path:
+                    file_path = last_path
+                last_path = file_path
+                files.append(file_path)
+                lines.append(data['line_number'])
+                snippets.append(_rg_text(data['lines']).strip())
+            elif kind == 'summary':
+                completed = True
+    
+    return columns if completed else None
+
+
+def _python_search(pattern: str, path: str, include: str) -> Iterable[GrepColumns]:
+    """
+    Scan files with the Python worker, in parallel for large trees.
+    
+    On the main thread batches go to a process pool, since the regex scan
+    holds the GIL. Elsewhere (e.g. the agent's concurrent tool pool), where
+    forking is unsafe, or if no process pool can be started, they go to a
+    thread pool, which still overlaps the file reads.
+    """
+    include_re = _compile_glob(include)
+    # An explicit include (say "*.pdf") still searches the files it names.
+    skip_extensions = GREP_SKIP_EXTENSIONS if include == '*' else frozenset()
+    file_paths = list(_iter_files(path, include_re, skip_extensions))
+    
+    batches = [
+        (file_paths[i:i + GREP_BATCH_SIZE], pattern)
+        for i in range(0, len(file_paths), GREP_BATCH_SIZE)
+    ]
+    
+    if len(file_paths) < GREP_PARALLEL_MIN_FILES:
+        return map(_grep_batch, batches)
+    
+    if threading.current_thread() is threading.main_thread():
+        try:
+            with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+                return list(executor.map(_grep_batch, batches))
+        except (OSError, BrokenProcessPool):
+            pass
+    
+    with ThreadPoolExecutor(max_workers=GREP_MAX_THREADS) as executor:
+        return list(executor.map(_grep_batch, batches))
+
+
 def grep_search(
     pattern: str,
     path: str = ".",
     include: str = "*"
 ) -> Dict[str, Any]:
-    """Search for pattern in files."""
-    try:
-        results = []
-        regex = re.compile(pattern)
-        
-        for root, dirs, files in os.walk(path):
-            for file in files:
-                if glob_module.fnmatch.fnmatch(file, include):
-                    file_path = os.path.join(root, file)
-                    try:
-                        with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                            for line_num, line in enumerate(f, 1):
-                                if regex.search(line):
-                                    results.append({
-                                        "file": file_path,
-                                        "line": line_num,
-                                        "content": line.strip()
-                                    })
-                    except (IOError, OSError, PermissionError):
-                        pass
-        
-        return {"success": True, "results": results, "count": len(results)}
+    """Search for pattern in files; files[i], lines[i] and snippets[i] describe the i-th match."""
+    try:
+        _compile_pattern(pattern)
+        
+        columns = None
+        rg = _ripgrep_path() if GREP_USE_RIPGREP else None
+        if rg is not None:
+            columns = _ripgrep_search(rg, pattern, path, include)
+        
+        if columns is None:
+            files, lines, snippets = columns = ([], [], [])
+            for batch_files, batch_lines, batch_snippets in _python_search(pattern, path, include):
+                files.extend(batch_files)
+                lines.extend(batch_lines)
+                snippets.extend(batch_snippets)
+        
+        files, lines, snippets = columns
+        return {
+            "success": True,
+            "files": files,
+            "lines": lines,
+            "snippets": snippets,
+            "count": len(files)
+        }
     except Exception as e:
         return {"success": False, "error": str(e)}
 
 
-def bash_command(command: str, timeout: int = 120000) -> Dict[str, Any]:
-    """Execute bash command."""
+class _OutputTail:
+    """Ring buffer holding the last `limit` bytes of a stream plus its total size."""
+    
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.total = 0
+        self._chunks: deque = deque()
+        self._size = 0
+    
+    def append(self, chunk: bytes):
+        self._chunks.append(chunk)
+        self._size += len(chunk)
+        self.total += len(chunk)
+        while self._size - len(self._chunks[0]) >= self.limit:
+            self._size -= len(self._chunks.popleft())
+    
+    def getvalue(self) -> str:
+        data = b''.join(self._chunks)[-self.limit:]
+        text = data.decode('utf-8', errors='replace')
+        return text.replace('\r\n', '\n').replace('\r', '\n')
+
+
+def _kill_group(proc) -> None:
+    """SIGKILL the process group a bash command runs in, children included."""
     try:
-        result = subprocess.run(
+        os.killpg(proc.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def _bash_result(exit_code: int, stdout_tail: _OutputTail, stderr_tail: _OutputTail) -> Dict[str, Any]:
+    result = {
+        "success": exit_code == 0,
+        "exit_code": exit_code,
+        "stdout": stdout_tail.getvalue(),
+        "stderr": stderr_tail.getvalue()
+    }
+    if stdout_tail.total > BASH_OUTPUT_LIMIT:
+        result["stdout_bytes"] = stdout_tail.total
+    if stderr_tail.total > BASH_OUTPUT_LIMIT:
+        result["stderr_bytes"] = stderr_tail.total
+    return result
+
+
+def bash_command(command: str, timeout: int = 120000, stream: bool = False) -> Dict[str, Any]:
+    """
+    Execute bash command.
+    
+    Only the last BASH_OUTPUT_LIMIT bytes of stdout and stderr are returned,
+    with the full size in stdout_bytes/stderr_bytes when cut. With
+    stream=True, output is also echoed to stderr live.
+    """
+    try:
+        proc = subprocess.Popen(
             command,
             shell=True,
-            capture_output=True,
-            text=True,
-            timeout=timeout / 1000,
-            cwd=os.getcwd()
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            cwd=os.getcwd(),
+            start_new_session=True
         )
-        return {
-            "success": result.returncode == 0,
-            "exit_code": result.returncode,
-            "stdout": result.stdout,
-            "stderr": result.stderr
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+    
+    try:
+        tails = {
+            proc.stdout: _OutputTail(BASH_OUTPUT_LIMIT),
+            proc.stderr: _OutputTail(BASH_OUTPUT_LIMIT),
         }
+        echo = getattr(sys.stderr, 'buffer', None) if stream else None
+        deadline = time.monotonic() + timeout / 1000
+        
+        with selectors.DefaultSelector() as selector:
+            for pipe in tails:
+                selector.register(pipe, selectors.EVENT_READ)
+            
+            while selector.get_map():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise subprocess.TimeoutExpired(command, timeout / 1000)
+                
+                for key, _ in selector.select(remaining):
+                    chunk = os.read(key.fd, 65536)
+                    if not chunk:
+                        selector.unregister(key.fileobj)
+                        continue
+                    tails[key.fileobj].append(chunk)
+                    if echo is not None:
+                        echo.write(chunk)
+                        echo.flush()
+        
+        exit_code = proc.wait(timeout=max(0, deadline - time.monotonic()))
+        return _bash_result(exit_code, tails[proc.stdout], tails[proc.stderr])
     except subprocess.TimeoutExpired:
+        _kill_group(proc)
+        proc.wait()
         return {"success": False, "error": "Command timed out"}
     except Exception as e:
+        _kill_group(proc)
+        proc.wait()
+        return {"success": False, "error": str(e)}
+    finally:
+        proc.stdout.close()
+        proc.stderr.close()
+
+
+async def _drain(reader: asyncio.StreamReader, tail: _OutputTail):
+    while True:
+        chunk = await reader.read(65536)
+        if not chunk:
+            return
+        tail.append(chunk)
+
+
+async def bash_command_async(command: str, timeout: int = 120000) -> Dict[str, Any]:
+    """Async variant of bash_command."""
+    try:
+        proc = await asyncio.create_subprocess_shell(
+            command,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            cwd=os.getcwd(),
+            start_new_session=True
+        )
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+    
+    stdout_tail = _OutputTail(BASH_OUTPUT_LIMIT)
+    stderr_tail = _OutputTail(BASH_OUTPUT_LIMIT)
+    try:
+        await asyncio.wait_for(
+            asyncio.gather(_drain(proc.stdout, stdout_tail), _drain(proc.stderr, stderr_tail), proc.wait()),
+            timeout / 1000
+        )
+        return _bash_result(proc.returncode, stdout_tail, stderr_tail)
+    except asyncio.TimeoutError:
+        _kill_group(proc)
+        await proc.wait()
+        return {"success": False, "error": "Command timed out"}
+    except asyncio.CancelledError:
+        _kill_group(proc)
+        raise
+    except Exception as e:
+        _kill_group(proc)
+        await proc.wait()
         return {"success": False, "error": str(e)}
 
 
 def list_files(path: str = ".") -> Dict[str, Any]:
-    """List files in directory."""
-    try:
-        files = []
-        for item in os.listdir(path):
-            item_path = os.path.join(path, item)
-            files.append({
-                "name": item,
-                "path": item_path,
-                "is_dir": os.path.isdir(item_path)
-            })
+    """List files in directory; listings are cached until it changes (see clear_cache)."""
+    try:
+        abs_path = os.path.abspath(path)
+        mtime_ns = os.stat(path).st_mtime_ns
+        
+        with _listdir_lock:
+            cached = _listdir_cache.get(abs_path)
+            if cached is not None and cached[0] == mtime_ns:
+                _listdir_cache.move_to_end(abs_path)
+                entries = cached[1]
+            else:
+                entries = None
+        
+        if entries is None:
+            with os.scandir(path) as it:
+                entries = tuple((entry.name, entry.is_dir()) for entry in it)
+            if time.time_ns() - mtime_ns > LISTDIR_SETTLE_NS:
+                with _listdir_lock:
+                    _listdir_cache[abs_path] = (mtime_ns, entries)
+                    _listdir_cache.move_to_end(abs_path)
+                    while len(_listdir_cache) > LISTDIR_CACHE_SIZE:
+                        _listdir_cache.popitem(last=False)
+        
+        files = [
+            {"name": name, "path": os.path.join(path, name), "is_dir": is_dir}
+            for name, is_dir in entries
+        ]
         return {"success": True, "files": files}
     except Exception as e:
         return {"success": False, "error": str(e)}
+
+
+# Built once; each ToolRegistry starts from a copy it can register into.
+_DEFAULT_TOOLS: Mapping[str, Callable] = MappingProxyType({
+    "read": read_file,
+    "write": write_file,
+    "edit": edit_file,
+    "glob": glob_search,
+    "grep": grep_search,
+    "bash": bash_command,
+    "list_files": list_files,
+})